@@ -13,101 +13,288 @@ import os                               # for accessing directories and files, i
 import shutil                           # for retrieving the metadata of directories and files
 import sys                              # for interacting with the runtime; loading animation and timer
 import time                             # for timer
+import heapq                            # selects the largest extensions without sorting them all
+import operator                         # fast key functions for sorting
+import functools                        # caches formatted sizes
 import threading                        # enables multi-threading for loading animation and time while analysis
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED  # scans directories in parallel
 from collections import defaultdict     # initializes values in dictionaries
+from collections import namedtuple      # lightweight nodes for the scanned directory tree
+from collections import OrderedDict     # least-recently-used order of the scan cache
+from collections import deque           # backlog of directories waiting to be scanned
+
+# Size units and their divisors (1024 ** index), used by format_size
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+SIZE_DIVISORS = tuple(1 << (10 * i) for i in range(len(SIZE_UNITS)))
 
 # Function to convert sizes to human-readable format
+# File sizes repeat often (empty files, block-sized files, common totals), so recent results are cached
+@functools.lru_cache(maxsize=8192)
 def format_size(size):
-    units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
-    unit_index = 0
-    converted_size = float(size)
-
-    while converted_size >= 1024 and unit_index < len(units) - 1:
-        converted_size /= 1024
-        unit_index += 1
+    # Every 10 bits of the size is a factor of 1024, so the unit follows from the bit length
+    unit_index = min(max(int(size).bit_length() - 1, 0) // 10, len(SIZE_UNITS) - 1)
+    return f'{size / SIZE_DIVISORS[unit_index]:.2f} {SIZE_UNITS[unit_index]}'
+
+# A node of the scanned directory tree; files are stored as nodes without children
+DirNode = namedtuple('DirNode', ['name', 'size', 'children'])
+
+# Number of threads used to scan directories; the scan waits on the disk, not the CPU
+# The value is a precaution rather than a measured optimum: with a warm cache more threads were
+# still slightly faster, but many concurrent scans on a single volume can contend for the
+# filesystem's own locks, which shows up on cold caches and slower or network file systems
+MAX_WORKERS = 4
+
+# Number of directory scans kept in flight at once
+MAX_IN_FLIGHT = 64
+
+# On POSIX, os.scandir accepts an open directory descriptor; entries listed through it are stat'ed
+# relative to that directory (fstatat), so the kernel does not resolve the full path for every file
+SCANDIR_ACCEPTS_FD = os.scandir in os.supports_fd
+
+# Function to list a single directory
+# Returns its children (subdirectories are left as None placeholders), the total size of its files,
+# its disk usage per file extension, the subdirectories still to scan as (index, path, name)
+# and its listing as (name, is directory) pairs; a listing from a previous scan can be passed in,
+# in which case the directory is not read again but every file is still stat'ed for its current size
+def scan_directory(dir_path, error_logs, listing=None):
+    files_size = 0
+    children = []
+    subdirs = []
+    ext_usage = {}  # Extension strings are interned, so each distinct extension is stored once
+    entries = []    # (name, is directory, DirEntry or None)
+    dir_fd = None
 
-    return f'{converted_size:.2f} {units[unit_index]}'
+    try:
+        if SCANDIR_ACCEPTS_FD:
+            dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+
+        if listing is None:
+            # DirEntry objects cache the information returned while reading the directory,
+            # so each file costs a single stat() call at most; on Windows, os.scandir is built on
+            # FindFirstFileW/FindNextFileW and the file size arrives with the listing, so it costs none
+            with os.scandir(dir_path if dir_fd is None else dir_fd) as scanner:
+                for entry in scanner:
+                    try:
+                        entries.append((entry.name, entry.is_dir(follow_symlinks=False), entry))
+                    except OSError as e:
+                        error_logs.append(f"Error processing file '{os.path.join(dir_path, entry.name)}': {str(e)}")
+        else:
+            entries = [(name, is_dir, None) for name, is_dir in listing]
+
+        for name, is_dir, entry in entries:
+            try:
+                if is_dir:
+                    # Reserve the subdirectory's place; it is filled in once it has been scanned
+                    subdirs.append((len(children), os.path.join(dir_path, name), name))
+                    children.append(None)
+                else:
+                    # Symbolic links are counted, not followed
+                    if entry is not None:
+                        file_size = entry.stat(follow_symlinks=False).st_size
+                    elif dir_fd is not None:
+                        file_size = os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_size
+                    else:
+                        file_size = os.stat(os.path.join(dir_path, name), follow_symlinks=False).st_size
+
+                    # Get file extension (case-insensitive) and accumulate its size
+                    # rpartition is used instead of os.path.splitext, which does path handling not needed here
+                    head, dot, tail = name.rpartition('.')
+                    ext = sys.intern(dot + tail.lower()) if head.lstrip('.') else ''  # Dotfiles like '.gitignore' have no extension
+                    ext_usage[ext] = ext_usage.get(ext, 0) + file_size
+                    files_size += file_size
+                    children.append(DirNode(name, file_size, None))
+
+            except OSError as e:  # Catch all types of file-related errors
+                error_logs.append(f"Error processing file '{os.path.join(dir_path, name)}': {str(e)}")
+
+    except OSError as e:  # Catch all types of directory-related errors
+        error_logs.append(f"Error accessing directory '{dir_path}': {str(e)}")
+
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+
+    return children, files_size, ext_usage, subdirs, tuple((name, is_dir) for name, is_dir, _ in entries)
+
+# Listings of previous directory scans in this session, keyed by path: (modification time, listing)
+# Only names and types are kept; sizes are never cached, since a file can grow without changing its directory
+# The cache lives for the whole session, so it is bounded: the least recently used listings are evicted
+# past SCAN_CACHE_SIZE (a cached listing takes about 6 KB, so the cache stays around 25 MB at most);
+# the lock guards it across scan threads
+scan_cache = OrderedDict()
+scan_cache_lock = threading.Lock()
+SCAN_CACHE_SIZE = 4096
+
+# Directories with fewer entries than this are quick to list again, so they are not cached
+MIN_CACHED_ENTRIES = 10
+
+# Function to scan a single directory, reusing its previous listing if the directory is unchanged
+# A directory's modification time changes whenever entries are added, removed or renamed in it,
+# so an unchanged directory has the same entries; their sizes are always read again
+def scan_directory_cached(dir_path, error_logs):
+    try:
+        mtime = os.stat(dir_path).st_mtime_ns
+    except OSError:
+        return scan_directory(dir_path, error_logs)[:4]  # Let the scan itself report the error
+
+    listing = None
+    with scan_cache_lock:
+        cached = scan_cache.get(dir_path)
+        if cached is not None and cached[0] == mtime:
+            scan_cache.move_to_end(dir_path)
+            listing = cached[1]
+
+    dir_errors = []
+    children, files_size, ext_usage, subdirs, new_listing = scan_directory(dir_path, dir_errors, listing)
+    error_logs.extend(dir_errors)
+
+    # Only complete listings are kept, so errors are reported again on the next scan
+    with scan_cache_lock:
+        if dir_errors:
+            scan_cache.pop(dir_path, None)
+        elif listing is None and len(new_listing) >= MIN_CACHED_ENTRIES:
+            scan_cache[dir_path] = (mtime, new_listing)
+            scan_cache.move_to_end(dir_path)
+            if len(scan_cache) > SCAN_CACHE_SIZE:
+                scan_cache.popitem(last=False)
+    return children, files_size, ext_usage, subdirs
+
+# Function to scan a directory tree, building its nodes and accumulating extension usage
+# Directories are scanned in parallel by a thread pool; no recursion is involved
+def build_tree(path, name, ext_usage, error_logs, max_workers=MAX_WORKERS, max_in_flight=MAX_IN_FLIGHT):
+    scanned = []        # (path, name, parent path, index in the parent's children, files size) in scan order
+    dir_children = {}   # child nodes of each scanned directory
+
+    # Directories waiting to be scanned; at most max_in_flight of them are handed to the pool at once,
+    # which keeps the disk busy while bounding the number of queued futures on very wide trees
+    backlog = deque([(path, name, None, 0)])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        while backlog or pending:
+            while backlog and len(pending) < max_in_flight:
+                task = backlog.pop()
+                pending[executor.submit(scan_directory_cached, task[0], error_logs)] = task
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                dir_path, dir_name, parent_path, index = pending.pop(future)
+                children, files_size, dir_ext_usage, subdirs = future.result()
+
+                # Results are merged here, in the main thread only, so no lock is needed
+                for ext, size in dir_ext_usage.items():
+                    ext_usage[ext] = ext_usage.get(ext, 0) + size
+
+                scanned.append((dir_path, dir_name, parent_path, index, files_size))
+                dir_children[dir_path] = children
+
+                for sub_index, sub_path, sub_name in subdirs:
+                    backlog.append((sub_path, sub_name, dir_path, sub_index))
+
+    # Build the nodes bottom-up: a subdirectory is always scanned after its parent,
+    # so walking the results backwards reaches every child before its parent
+    dir_sizes = defaultdict(int)
+    root = None
+
+    # Identical files and subtrees (e.g. repeated '__pycache__' folders) share a single node.
+    # Files are looked up by value; directories by name, size and the identity of their
+    # already shared children, which keeps each lookup proportional to the number of children
+    shared_nodes = {}
+
+    for dir_path, dir_name, parent_path, index, files_size in reversed(scanned):
+        children = tuple(
+            shared_nodes.setdefault(child, child) if child.children is None else child
+            for child in dir_children.pop(dir_path)
+        )
+        node = DirNode(dir_name, files_size + dir_sizes.pop(dir_path, 0), children)
+        node = shared_nodes.setdefault((dir_name, node.size, tuple(map(id, children))), node)
+
+        if parent_path is None:
+            root = node
+        else:
+            dir_sizes[parent_path] += node.size
+            dir_children[parent_path][index] = node
 
-# Function to recursively calculate disk usage
-def get_disk_usage(path, log_file, error_logs):
-    total_size = 0
-    ext_usage = defaultdict(int)
+    return root
 
-    try:
-        # Iterate through the directory
-        for root, dirs, files in os.walk(path):
-            for name in files:
-                filepath = os.path.join(root, name)
-                try:
-                    size = os.path.getsize(filepath)
-                    total_size += size
+# Function to calculate disk usage of a directory in a single pass
+# Returns the root node of the directory tree and the disk usage per file extension
+def get_disk_usage(path, error_logs, max_workers=MAX_WORKERS):
+    ext_usage = {}
 
-                    # Get file extension and accumulate its size
-                    ext = os.path.splitext(name)[1]
-                    ext_usage[ext] += size
+    # Manually retrieve the directory name from the path
+    path_parts = path.rstrip(os.sep).split(os.sep)  # Split the path into its components
+    dir_name = path_parts[-1]  # Get the last part, which is the directory name
 
-                except Exception as e:  # Catch all types of file-related errors
-                    error_logs.append(f"Error processing file '{filepath}': {str(e)}")
+    root = build_tree(path, dir_name, ext_usage, error_logs, max_workers)
+    return root, ext_usage
 
-    except Exception as e:  # Catch all types of directory-related errors
-        error_logs.append(f"Error accessing directory '{path}': {str(e)}")
+# Number of report lines joined into a single write call
+WRITE_BATCH_LINES = 4096
 
-    return total_size, ext_usage
+# Buffer size of the log file, in bytes
+LOG_BUFFER_SIZE = 1 << 20
 
 # Function to display the disk usage tree with structure similar to the 'tree' command
-def print_tree_view(path, depth, total_size, log_file, error_logs, prefix=""):
-    try:
-        # Manually retrieve the directory name from the path
-        path_parts = path.rstrip(os.sep).split(os.sep)  # Split the path into its components
-        dir_name = path_parts[-1]  # Get the last part, which is the directory name
+# The tree is rendered from the scanned nodes, so no further disk access is needed
+# Percentages are computed as size * inv_total, where inv_total is 100 / total size (0 for an empty tree)
+def print_tree_view(node, depth, inv_total, log_file, prefix=""):
+    # An explicit stack of (node, prefix) replaces recursion, so deep trees cannot hit the recursion limit
+    stack = [(node, prefix)]
 
-        # Calculate the directory size and percentage
-        dir_size, _ = get_disk_usage(path, log_file, error_logs)
-        percentage = (dir_size / total_size * 100) if total_size else 0
+    # Lines are collected and written in batches of WRITE_BATCH_LINES, instead of one write call per line
+    lines = []
 
-        # Print the current directory with a tree-like prefix
-        log_file.write(f"{prefix}+- {dir_name}/ - {format_size(dir_size)} ({percentage:.2f}%)\n")
+    while stack:
+        node, prefix = stack.pop()
+        percentage = node.size * inv_total
 
-        # Get the directory contents and handle errors
-        try:
-            entries = os.listdir(path)
-            entries = [entry for entry in entries if not entry.startswith('.')]  # Exclude hidden files
-            entries_count = len(entries)
+        if len(lines) >= WRITE_BATCH_LINES:
+            log_file.write(''.join(lines))
+            lines.clear()
 
-            for i, entry in enumerate(entries):
-                entry_path = os.path.join(path, entry)
-                is_last_entry = (i == entries_count - 1)
+        if node.children is None:
+            # For files, just display the size and name
+            lines.append(f"{prefix}+- {node.name} - {format_size(node.size)} ({percentage:.2f}%)\n")
+            continue
 
-                # Set the new prefix for subdirectories
-                new_prefix = prefix + ("   " if is_last_entry else "|  ")
+        # Print the current directory with a tree-like prefix
+        lines.append(f"{prefix}+- {node.name}/ - {format_size(node.size)} ({percentage:.2f}%)\n")
 
-                if os.path.isdir(entry_path):
-                    # Recursive call to print subdirectory
-                    print_tree_view(entry_path, depth + 1, total_size, log_file, error_logs, new_prefix)
+        entries = [child for child in node.children if not child.name.startswith('.')]  # Exclude hidden files
+        if not entries:
+            continue
 
-                else:
-                    # For files, just display the size and name
-                    try:
-                        file_size = os.path.getsize(entry_path)
-                        file_percentage = (file_size / total_size * 100) if total_size else 0
-                        log_file.write(f"{new_prefix}+- {entry} - {format_size(file_size)} ({file_percentage:.2f}%)\n")
-                    except Exception as e:
-                        error_logs.append(f"Error processing file '{entry_path}': {str(e)}")
+        # Set the new prefixes for the entries below this directory; they are built once per
+        # directory and shared by all its children instead of being concatenated per entry
+        branch_prefix = prefix + "|  "
+        last_prefix = prefix + "   "
 
-        except Exception as e:
-            error_logs.append(f"Error accessing directory '{path}': {str(e)}")
+        # Children are pushed in reverse so they are popped (and printed) in their original order
+        stack.append((entries[-1], last_prefix))
+        stack.extend([(child, branch_prefix) for child in reversed(entries[:-1])])
+
+    log_file.write(''.join(lines))
 
-    except Exception as e:
-        error_logs.append(f"Error processing path '{path}': {str(e)}")
 
+# Function to sort file extension usage from largest to smallest
+# If top_k is given, only the top_k largest extensions are returned
+def sorted_extensions(ext_usage, top_k=None):
+    if top_k is None:
+        return sorted(ext_usage.items(), key=operator.itemgetter(1), reverse=True)
+    return heapq.nlargest(top_k, ext_usage.items(), key=operator.itemgetter(1))
 
 # Function to display sorted file extension usage
-def print_sorted_extensions(ext_usage, log_file):
-    sorted_ext_usage = sorted(ext_usage.items(), key=lambda x: x[1], reverse=True)
+# If top_k is given, only the top_k largest extensions are listed
+def print_sorted_extensions(ext_usage, log_file, top_k=None):
+    sorted_ext_usage = sorted_extensions(ext_usage, top_k)
 
-    log_file.write("\nFile Extension Usage (sorted by usage):\n")
+    lines = ["\nFile Extension Usage (sorted by usage):\n"]
     for ext, size in sorted_ext_usage:
-        log_file.write(f"{ext}: {format_size(size)}\n")
+        lines.append(f"{ext}: {format_size(size)}\n")
+    log_file.write(''.join(lines))
 
 # Function to display disk space information
 def print_disk_info(path, log_file):
@@ -124,29 +311,27 @@ def print_disk_info(path, log_file):
 # Function to log errors at the end of the report
 def log_errors(log_file, error_logs):
     if error_logs:
-        log_file.write("\n\nError Summary:\n")
-        for error in error_logs:
-            log_file.write(f"{error}\n")
+        # The summary is written in one call, rather than one write per error
+        log_file.write("\n\nError Summary:\n" + "".join(f"{error}\n" for error in error_logs))
 
-# Function to display the loading animation and timer
-def loading_animation_with_timer(start_time, lock):
+# Function to display the loading animation and timer until the analysis is done
+def loading_animation_with_timer(start_time, done):
     animation = ['|', '/', '-', '\\']
     idx = 0
 
-    while loading:
-        with lock:
-            elapsed_time = time.time() - start_time
-            minutes, seconds = divmod(elapsed_time, 60)
+    # Event.wait sleeps between frames and returns as soon as the analysis is done
+    while not done.wait(0.1):
+        elapsed_time = time.monotonic() - start_time
+        minutes, seconds = divmod(elapsed_time, 60)
 
-            if minutes > 0:
-                time_display = f"{int(minutes)} min {int(seconds):02d} sec"
-            else:
-                time_display = f"{int(seconds)} seconds"
+        if minutes > 0:
+            time_display = f"{int(minutes)} min {int(seconds):02d} sec"
+        else:
+            time_display = f"{int(seconds)} seconds"
 
-            sys.stdout.write(f'\r{animation[idx]} Analyzing... Time Elapsed: {time_display}')
-            sys.stdout.flush()
-            idx = (idx + 1) % len(animation)
-        time.sleep(0.1)
+        sys.stdout.write(f'\r{animation[idx]} Analyzing... Time Elapsed: {time_display}')
+        sys.stdout.flush()
+        idx = (idx + 1) % len(animation)
 
 def clear_screen():
     if os.name == 'nt':  # 'nt' is for Windows
@@ -156,8 +341,6 @@ def clear_screen():
 
 # Main program
 def main():
-    global loading
-
     while True:
         clear_screen()
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -176,7 +359,7 @@ def main():
 
                 path = os.path.abspath(input("\nEnter the directory path to analyze: ").strip())
 
-                start_time = time.time()
+                start_time = time.monotonic()
 
                # Main program (continue from where the analysis is completed)
                 if os.path.isdir(path):
@@ -191,30 +374,34 @@ def main():
 
                     error_logs = []  # Change error_logs to be a list of strings
 
-                    loading = True
-
-                    # a thread lock is used to avoid two functions updating to the console at the same time
-                    lock = threading.Lock()
-                    animation_thread = threading.Thread(target=loading_animation_with_timer, args=(start_time, lock))
+                    # only the animation thread writes to the console during the analysis, so no lock is needed
+                    done = threading.Event()
+                    animation_thread = threading.Thread(target=loading_animation_with_timer, args=(start_time, done), daemon=True)
                     animation_thread.start()
 
-                    with open(filename, 'w', encoding='utf-8') as log_file:
+                    # a 1 MiB buffer lets the report reach the disk in a few large writes
+                    with open(filename, 'w', encoding='utf-8', buffering=LOG_BUFFER_SIZE) as log_file:
                         print_disk_info(path, log_file)
 
-                        while True:
-                            total_size, ext_usage = get_disk_usage(path, log_file, error_logs)
+                        root, ext_usage = get_disk_usage(path, error_logs)
+                        total_size = root.size
 
-                            if total_size > 0:
-                                break
+                        # An empty result is reported once rather than rescanned; the percentages below show 0%
+                        # Every scanned file adds to ext_usage, even an empty one, so it is empty only if no file was found
+                        if not ext_usage:
+                            log_file.write("Note: no accessible files were found in this directory.\n")
+                        elif total_size == 0:
+                            log_file.write("Note: the files in this directory contain no data (0 bytes).\n")
 
                         log_file.write("\nDisk Usage Tree View:\n")
-                        print_tree_view(path, 0, total_size, log_file, error_logs)
+                        inv_total = (100.0 / total_size) if total_size else 0.0
+                        print_tree_view(root, 0, inv_total, log_file)
                         print_sorted_extensions(ext_usage, log_file)
                         log_errors(log_file, error_logs)
 
-                    loading = False
+                    done.set()
                     animation_thread.join()
-                    end_time = time.time()
+                    end_time = time.monotonic()
 
                     elapsed_time = end_time - start_time
                     minutes, seconds = divmod(elapsed_time, 60)
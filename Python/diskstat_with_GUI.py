@@ -4,50 +4,17 @@ import shutil
 import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, Toplevel, Listbox
-from collections import defaultdict
 from queue import Queue
 
+# The scanner and formatting are shared with the console version
+from diskstat import get_disk_usage, format_size, sorted_extensions
 
-# Function to convert sizes to human-readable format
-def format_size(size):
-    units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
-    unit_index = 0
-    converted_size = float(size)
+# System directories that cannot be deleted from the program; normcase makes the check
+# case-insensitive on Windows and accepts the forward slashes returned by the directory dialog
+# Paths are matched on a directory boundary, so '/usr' protects '/usr/lib' but not '/usr2'
+PROTECTED_PREFIXES = tuple(os.path.normcase(p) for p in ('C:\\Windows', 'C:\\System32', '/boot', '/etc', '/usr', '/bin', '/sbin'))
+PROTECTED_DIR_PREFIXES = tuple(p + os.sep for p in PROTECTED_PREFIXES)
 
-    while converted_size >= 1024 and unit_index < len(units) - 1:
-        converted_size /= 1024
-        unit_index += 1
-
-    return f'{converted_size:.2f} {units[unit_index]}'
-
-# Function to parse human-readable size back into bytes (for sorting purposes)
-def parse_size(size_str):
-    size_str = size_str.replace(",", "")  # Remove commas if present
-    units = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4, 'PB': 1024**5}
-    size, unit = size_str.split()
-    return float(size) * units[unit]
-
-# Function to calculate disk usage for a directory
-def calculate_usage(path, error_logs, result_queue):
-    total_size = 0
-    ext_usage = defaultdict(int)
-
-    try:
-        for root, dirs, files in os.walk(path, onerror=lambda e: error_logs.append(f"Error accessing directory '{path}': {str(e)}")):
-            for name in files:
-                filepath = os.path.join(root, name)
-                try:
-                    size = os.path.getsize(filepath)
-                    total_size += size
-                    ext = os.path.splitext(name)[1]
-                    ext_usage[ext] += size
-                except Exception as e:
-                    error_logs.append(f"Error processing file '{filepath}': {str(e)}")
-        # Return the total size and extension usage
-        return total_size, ext_usage
-    except PermissionError as e:
-        error_logs.append(f"Permission denied: {str(e)}")
-        return total_size, ext_usage  # Return even on error
 
 class DiskUsageApp(tk.Tk):
     def __init__(self):
@@ -55,6 +22,9 @@ class DiskUsageApp(tk.Tk):
         self.title("Disk Usage Statistics")
         self.geometry("900x600")
         self.error_logs = []
+        self.unexpanded = {}  # Directory items not opened yet: iid -> (node, full path)
+        self.item_nodes = {}  # Scanned node of every inserted item, used for sorting without querying Tk
+        self.inv_total = 0.0
         self.analysis_running = False  # Add flag to track if the analysis is running
         self.sort_by = tk.StringVar(value="name")  # Track sorting option
         self.create_widgets()
@@ -101,7 +71,8 @@ class DiskUsageApp(tk.Tk):
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
         # Treeview widget for displaying directory structure and sizes
-        self.tree = ttk.Treeview(tree_frame, columns=("size", "percent"), show="tree")
+        # The full path is kept in a hidden column, for deletion
+        self.tree = ttk.Treeview(tree_frame, columns=("size", "percent", "path"), displaycolumns=("size", "percent"), show="tree")
         self.tree.heading("size", text="Size", command=lambda: self.sort_tree())
         self.tree.heading("percent", text="Percentage", command=lambda: self.sort_tree())
         self.tree.heading("#0", text="Name", command=lambda: self.sort_tree())
@@ -109,6 +80,9 @@ class DiskUsageApp(tk.Tk):
         self.tree.column("percent", width=100)
         self.tree.pack(fill=tk.BOTH, expand=True)
 
+        # Items are only created when their parent is opened, see expand_item
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+
         # Timer display
         self.timer_label = ttk.Label(self, text="Time Elapsed: 00:00")
         self.timer_label.pack(pady=5)
@@ -144,6 +118,7 @@ class DiskUsageApp(tk.Tk):
 
         # Create a queue for results
         self.result_queue = Queue()
+        self.analysis_path = path
         self.analysis_thread = threading.Thread(target=self.analyze_directory, args=(path,))
         self.analysis_thread.start()
         self.after(100, self.check_analysis)
@@ -156,17 +131,17 @@ class DiskUsageApp(tk.Tk):
             self.after(1000, self.update_timer)
 
     def analyze_directory(self, path):
-        # Calculate usage of the selected directory and populate the tree
-        total_size, ext_usage = calculate_usage(path, self.error_logs, self.result_queue)
-
-        if self.error_logs:
-            self.error_log_btn.config(state=tk.NORMAL)  # Enable error log button if there are errors
-
-        self.tree.insert('', 'end', text=path, values=(format_size(total_size), "100%"))
-        self.populate_tree(path, total_size)
-        self.populate_extensions(ext_usage)
-
-        self.analysis_running = False  # Stop the timer when analysis completes
+        # Calculate usage of the selected directory; Tk is not thread-safe,
+        # so the tree view is filled in by the main thread (see check_analysis)
+        # A result is always queued, even if the scan fails, since check_analysis waits for one
+        result = (None, {})
+        try:
+            result = get_disk_usage(path, self.error_logs)
+        except Exception as e:
+            self.error_logs.append(f"Error analyzing directory '{path}': {str(e)}")
+        finally:
+            self.result_queue.put(result)
+            self.analysis_running = False  # Stop the timer when analysis completes
 
     def check_analysis(self):
         if self.analysis_thread.is_alive():
@@ -176,62 +151,89 @@ class DiskUsageApp(tk.Tk):
             self.progress.pack_forget()  # Hide the progress bar after analysis completes
             self.analysis_running = False  # Stop the timer when analysis completes
 
-    def populate_tree(self, path, total_size):
-        def recursive_insert(parent, path, total_size):
-            try:
-                dir_size, ext_usage = calculate_usage(path, self.error_logs, self.result_queue)
-                percentage = (dir_size / total_size * 100) if total_size else 0
-                # Insert the full path as a value in the TreeView
-                node_id = self.tree.insert(parent, 'end', text=os.path.basename(path), values=(format_size(dir_size), f"{percentage:.2f}%", path))
-                
-                # Iterate over directory entries
-                for entry in os.scandir(path):
-                    if entry.is_dir(follow_symlinks=False):
-                        # Recursively insert directories
-                        recursive_insert(node_id, entry.path, total_size)
-                    elif entry.is_file(follow_symlinks=False):
-                        # Insert files into the tree with the full path
-                        try:
-                            file_size = os.path.getsize(entry.path)
-                            file_percentage = (file_size / total_size * 100) if total_size else 0
-                            self.tree.insert(node_id, 'end', text=entry.name, values=(format_size(file_size), f"{file_percentage:.2f}%", entry.path))
-                        except Exception as e:
-                            self.error_logs.append(f"Error processing file '{entry.path}': {str(e)}")
-            except PermissionError as e:
-                self.error_logs.append(f"Permission denied: {str(e)}")
-
-        # Start recursive insertion from the selected path
-        recursive_insert('', path, total_size)
-
+            root, ext_usage = self.result_queue.get()
+            if root is not None:
+                self.populate_tree(self.analysis_path, root)
+            self.populate_extensions(ext_usage)
+
+            if self.error_logs:
+                self.error_log_btn.config(state=tk.NORMAL)  # Enable error log button if there are errors
+
+    def populate_tree(self, path, root):
+        # Percentages are computed as size * inv_total, so each item costs a multiplication instead of a division
+        self.inv_total = (100.0 / root.size) if root.size else 0.0
+
+        # Only the selected directory and its entries are inserted now; deeper levels are inserted
+        # when their directory is opened, so loading a large tree costs as much as listing its top level
+        self.tree.insert('', 'end', text=path, values=(format_size(root.size), "100%"))  # Header row, not a deletable entry
+        root_id = self.insert_item('', root, path, os.path.basename(path))
+        if root_id in self.unexpanded:  # An empty or unreadable directory has nothing to expand
+            self.expand_item(root_id)
+            self.tree.item(root_id, open=True)
+
+    def insert_item(self, parent, node, node_path, text):
+        # Insert the full path as a value in the TreeView
+        percentage = node.size * self.inv_total
+        iid = self.tree.insert(parent, 'end', text=text, values=(format_size(node.size), f"{percentage:.2f}%", node_path))
+        self.item_nodes[iid] = node
+
+        # Non-empty directories get an empty placeholder child, so they show an expander until opened
+        if node.children:
+            self.unexpanded[iid] = (node, node_path)
+            self.tree.insert(iid, 'end')
+        return iid
+
+    def expand_item(self, iid):
+        # Replace the placeholder with the directory's entries, in the currently selected order
+        node, node_path = self.unexpanded.pop(iid)
+        self.tree.delete(*self.tree.get_children(iid))
+
+        for child in sorted(node.children, key=self.node_sort_key(), reverse=(self.sort_order.get() == "descending")):
+            self.insert_item(iid, child, os.path.join(node_path, child.name), child.name)
+
+    def on_tree_open(self, event):
+        iid = self.tree.focus()
+        if iid in self.unexpanded:
+            self.expand_item(iid)
 
     def populate_extensions(self, ext_usage):
-        sorted_ext_usage = sorted(ext_usage.items(), key=lambda x: x[1], reverse=True)
-        for ext, size in sorted_ext_usage:
-            self.extension_list.insert(tk.END, f"{ext}: {format_size(size)}")
+        # The lines are formatted first and added to the list box in a single insert call
+        lines = [f"{ext}: {format_size(size)}" for ext, size in sorted_extensions(ext_usage)]
+        if lines:
+            self.extension_list.insert(tk.END, *lines)
+
+    # Returns the key that orders scanned nodes by the selected option (name or size)
+    def node_sort_key(self):
+        if self.sort_by.get() == "name":
+            return lambda node: node.name.lower()
+        return lambda node: node.size
 
     def sort_tree(self):
-        sort_by = self.sort_by.get()
         sort_order = self.sort_order.get()  # Get the selected sort order (ascending/descending)
 
-        # Sort the tree recursively
-        def recursive_sort(node):
-            children = self.tree.get_children(node)
+        # Items are sorted by their scanned nodes, so no comparison needs a round-trip to Tk
+        node_key = self.node_sort_key()
+        item_nodes = self.item_nodes
+        key = lambda child: node_key(item_nodes[child])
 
-            if sort_by == "name":
-                sorted_children = sorted(children, key=lambda child: self.tree.item(child, "text").lower(), reverse=(sort_order == "descending"))
-            elif sort_by == "size":
-                sorted_children = sorted(children, key=lambda child: parse_size(self.tree.set(child, "size")), reverse=(sort_order == "descending"))
+        # Sort the tree with an explicit stack instead of recursion, so deep trees cannot hit the recursion limit
+        # Only the children of the root node (header) are sorted
+        stack = list(self.tree.get_children(''))
+        while stack:
+            node = stack.pop()
+            if node in self.unexpanded:
+                continue  # Sorted when it is opened
 
-            # Rearrange items in sorted order
-            for index, child in enumerate(sorted_children):
-                self.tree.move(child, node, index)
-                recursive_sort(child)  # Sort the children of each node recursively
+            children = self.tree.get_children(node)
+            if not children:
+                continue
+
+            sorted_children = sorted(children, key=key, reverse=(sort_order == "descending"))
 
-        # Get the root node (header) and only sort its children
-        root = self.tree.get_children('')
-        if root:
-            for child in root:
-                recursive_sort(child)
+            # Rearrange items in sorted order, replacing the whole child list in a single call
+            # instead of moving each child into place one at a time
+            self.tree.set_children(node, *sorted_children)
+            stack.extend(sorted_children)  # Sort the children of each node as well
 
 
     def delete_directory(self):
@@ -239,6 +241,9 @@ class DiskUsageApp(tk.Tk):
         if selected_item:
             # Get the full path from the Treeview values (third value is the full path)
             node_id = selected_item[0]
+            if node_id not in self.item_nodes:
+                return  # The header row has no path of its own
+
             item_values = self.tree.item(node_id, 'values')
             full_path = item_values[2]  # The full path is stored as the third value
 
@@ -248,8 +253,8 @@ class DiskUsageApp(tk.Tk):
                 return
 
             # Safeguard: Don't allow deletion of critical system directories
-            system_dirs = ['C:\\Windows', 'C:\\System32']
-            if any(full_path.startswith(sys_dir) for sys_dir in system_dirs):
+            normalized_path = os.path.normcase(full_path)
+            if normalized_path in PROTECTED_PREFIXES or normalized_path.startswith(PROTECTED_DIR_PREFIXES):
                 messagebox.showerror("Error", "Deletion of system files is not allowed.")
                 return
 
@@ -262,12 +267,22 @@ class DiskUsageApp(tk.Tk):
                         shutil.rmtree(full_path)
                     else:
                         os.remove(full_path)
+                    self.forget_items(node_id)
                     self.tree.delete(selected_item)
                     messagebox.showinfo("Success", f"{full_path} deleted successfully.")
                 except Exception as e:
                     messagebox.showerror("Error", f"Failed to delete {full_path}: {str(e)}")
 
 
+    # Drops an item and all its descendants from the node maps, before the item is deleted from the tree
+    def forget_items(self, iid):
+        stack = [iid]
+        while stack:
+            item = stack.pop()
+            self.item_nodes.pop(item, None)
+            self.unexpanded.pop(item, None)
+            stack.extend(self.tree.get_children(item))
+
     def show_error_logs(self):
         error_window = Toplevel(self)
         error_window.title("Error Logs")
@@ -281,6 +296,8 @@ class DiskUsageApp(tk.Tk):
 
     def clear_tree(self):
         self.tree.delete(*self.tree.get_children())
+        self.unexpanded.clear()
+        self.item_nodes.clear()
         self.extension_list.delete(0, tk.END)
 
 if __name__ == "__main__":